@@ -4,24 +4,141 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog
 import threading
-import requests
-from bs4 import BeautifulSoup
-import json
+import queue
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import aiohttp
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve as sv
+import orjson
 import re
-import time # <--- この行を追加しました
+
+# brotliがインストールされていればaiohttpがBrotli圧縮を自動で展開できるため、転送量の少ないbrを優先して要求する
+try:
+    import brotli # noqa: F401
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 1.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
+    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+# 同時リクエスト数の上限 (サーバー負荷軽減のため控えめに設定)
+MAX_CONCURRENT_REQUESTS = 4
+# 連続する空白を1つにまとめるための正規表現 (毎回のコンパイルを避ける)
+_WS_RE = re.compile(r'\s+')
+# analyze_htmlが参照する領域だけをパースし、それ以外のDOMは構築しない
+AMAZON_STRAINER = SoupStrainer(id=[
+    'ppd',
+    'detailBullets_feature_div',
+    'productDetails_feature_div',
+    'productDetails_techSpec_section_1',
+])
+# ページごとにセレクタを再解析しないよう、コンパイル済みのものを使い回す
+_SEL_PRICE_WHOLE = sv.compile('.a-price-whole')
+_SEL_PRICE_FRACTION = sv.compile('.a-price-fraction')
+_SEL_DETAIL_ITEMS = sv.compile('li')
+_SEL_DETAIL_KEY = sv.compile('span.a-text-bold')
+
+async def _fetch(session, url, sem):
+    """セマフォで同時実行数を制限しながら1ページのHTMLを取得する"""
+    async with sem:
+        async with session.get(url, headers=HEADERS, timeout=aiohttp.ClientTimeout(total=20)) as response:
+            response.raise_for_status()
+            return await response.text()
+
+async def _fetch_all(urls):
+    """全URLを並行して取得する。失敗したURLは例外オブジェクトを結果として返す"""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*[_fetch(session, url, sem) for url in urls], return_exceptions=True)
+
+def analyze_html(html):
+    """HTML文字列から指定された領域の情報を抽出する (プロセスプールから呼べるようモジュール関数とする)"""
+    soup = BeautifulSoup(html, 'lxml', parse_only=AMAZON_STRAINER)
+    data = {}
+
+    # --- 領域1: div#ppd (価格、タイトル、箇条書きなど) ---
+    ppd_div = soup.find('div', id='ppd')
+    if ppd_div:
+        # 商品タイトル
+        title_tag = ppd_div.find('span', id='productTitle')
+        data['product_title'] = title_tag.text.strip() if title_tag else 'N/A'
+
+        # ブランド
+        byline_tag = ppd_div.find('div', id='bylineInfo_feature_div')
+        data['brand'] = byline_tag.text.strip() if byline_tag else 'N/A'
+
+        # 価格
+        price_whole = _SEL_PRICE_WHOLE.select_one(ppd_div)
+        price_fraction = _SEL_PRICE_FRACTION.select_one(ppd_div)
+        if price_whole and price_fraction:
+            data['price'] = price_whole.get_text().strip() + price_fraction.get_text().strip()
+        else:
+            data['price'] = 'N/A'
+
+        # 箇条書き (商品の特徴)
+        feature_bullets_ul = ppd_div.find('ul', class_='a-unordered-list a-vertical a-spacing-mini')
+        if feature_bullets_ul:
+            feature_items = _SEL_DETAIL_ITEMS.select(feature_bullets_ul)
+            data['feature_bullets'] = [li.get_text().strip() for li in feature_items]
+
+    # --- 領域2: div.a-column.a-span12.a-span-last (詳細情報テーブル) ---
+    # このクラス名は一般的すぎるため、より具体的なIDやクラスで絞り込む
+    details_div = soup.find('div', id='detailBullets_feature_div') # 新しいレイアウト
+    if not details_div:
+        details_div = soup.find('div', id='productDetails_feature_div') # 古いレイアウト
+
+    if details_div:
+        details = {}
+        # 新しいレイアウト (箇条書き形式)
+        for li in _SEL_DETAIL_ITEMS.select(details_div):
+            key_tag = _SEL_DETAIL_KEY.select_one(li)
+            if key_tag:
+                key = key_tag.text.replace(':', '').replace('\n', '').strip()
+                # 兄弟要素の探索は1回だけ行い、結果を使い回す
+                value_tag = key_tag.find_next_sibling('span')
+                details[key] = value_tag.get_text().strip() if value_tag else ''
+        data['product_details_list'] = details
+
+    # 古いレイアウト (テーブル形式)
+    tech_spec_table = soup.find('table', id='productDetails_techSpec_section_1')
+    if tech_spec_table:
+        tech_specs = {}
+        for tr in tech_spec_table.find_all('tr'):
+            th = tr.find('th')
+            td = tr.find('td')
+            if th and td:
+                key = th.text.strip()
+                value = td.text.strip()
+                tech_specs[key] = _WS_RE.sub(' ', value)
+        data['product_details_table'] = tech_specs
+
+    return data
 
 class AmazonAnalyzerApp(tk.Tk):
     """
     Amazon商品ページのHTML構造を解析するためのGUIアプリケーション。
     """
+    LOG_DRAIN_INTERVAL_MS = 100
+    LOG_DRAIN_MAX_MESSAGES = 500
+
     def __init__(self):
         super().__init__()
         self.title("Amazon商品ページ HTML解析ツール")
         self.geometry("800x600")
 
         self.analysis_results = []
+        self._log_q = queue.Queue()
 
         self.create_widgets()
+        self.after(self.LOG_DRAIN_INTERVAL_MS, self._drain_log)
 
     def create_widgets(self):
         main_frame = ttk.Frame(self, padding="10")
@@ -48,10 +165,22 @@ class AmazonAnalyzerApp(tk.Tk):
         self.log_area.pack(fill=tk.BOTH, expand=True)
 
     def log(self, message):
-        """ログエリアにメッセージを追記する"""
-        self.log_area.insert(tk.END, message + '\n')
-        self.log_area.see(tk.END)
-        self.update_idletasks()
+        """ログをキューに積む (ウィジェットへの反映はメインスレッドの_drain_logが行う)"""
+        self._log_q.put(message)
+
+    def _drain_log(self):
+        """キューに溜まったログをまとめてログエリアに追記し、次回の実行を予約する"""
+        messages = []
+        try:
+            while len(messages) < self.LOG_DRAIN_MAX_MESSAGES:
+                messages.append(self._log_q.get_nowait())
+        except queue.Empty:
+            pass
+
+        if messages:
+            self.log_area.insert(tk.END, '\n'.join(messages) + '\n')
+            self.log_area.see(tk.END)
+        self.after(self.LOG_DRAIN_INTERVAL_MS, self._drain_log)
 
     def start_analysis(self):
         """解析処理を別スレッドで開始する"""
@@ -72,110 +201,57 @@ class AmazonAnalyzerApp(tk.Tk):
         thread.start()
 
     def run_analysis_thread(self, urls):
-        """バックグラウンドでスクレイピングと解析を実行する"""
-        self.log(f"解析を開始します... 対象URL: {len(urls)}件")
-        
-        session = requests.Session()
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 1.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
-            "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
-        }
-        
-        for i, url in enumerate(urls):
-            self.log(f"\n--- [{i+1}/{len(urls)}] URLを解析中: {url[:50]}...")
-            try:
-                response = session.get(url, headers=headers, timeout=20)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                product_data = self.analyze_html(soup)
-                
-                if product_data:
-                    self.analysis_results.append({"url": url, "data": product_data})
-                    self.log("✅ 解析成功。")
-                else:
-                    self.log("⚠️ ページ構造が異なるため、主要な情報を取得できませんでした。")
-
-            except requests.exceptions.HTTPError as e:
-                self.log(f"❌ HTTPエラー: {e.response.status_code} - ページが存在しないか、アクセスがブロックされた可能性があります。")
-            except requests.exceptions.RequestException as e:
-                self.log(f"❌ リクエストエラー: {e}")
-            except Exception as e:
-                self.log(f"❌ 不明なエラー: {e}")
-            
-            time.sleep(2) # サーバー負荷軽減
+        """バックグラウンドでページを並行取得し、解析を実行する"""
+        self.log(f"解析を開始します... 対象URL: {len(urls)}件 (同時接続数: {MAX_CONCURRENT_REQUESTS})")
+
+        loop = asyncio.new_event_loop()
+        try:
+            pages = loop.run_until_complete(_fetch_all(urls))
+        finally:
+            loop.close()
+
+        # HTMLのパースはCPUバウンドなので、GILの影響を受けないプロセスプールで並列に実行する
+        # (Tkのメインループが動くマルチスレッドのプロセスをforkしないよう、spawnで起動する)
+        workers = max(1, min(os.cpu_count() or 1, len(pages)))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            jobs = [
+                page if isinstance(page, BaseException) else pool.submit(analyze_html, page)
+                for page in pages
+            ]
+
+            for i, (url, job) in enumerate(zip(urls, jobs)):
+                self.log(f"\n--- [{i+1}/{len(urls)}] URLを解析中: {url[:50]}...")
+                try:
+                    if isinstance(job, BaseException):
+                        raise job
+
+                    product_data = job.result()
+                    
+                    if product_data:
+                        self.analysis_results.append({"url": url, "data": product_data})
+                        self.log(f"✅ 解析成功。(取得項目: {', '.join(product_data)})")
+                    else:
+                        self.log("⚠️ ページ構造が異なるため、主要な情報を取得できませんでした。")
+
+                except aiohttp.ClientResponseError as e:
+                    self.log(f"❌ HTTPエラー: {e.status} - ページが存在しないか、アクセスがブロックされた可能性があります。")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.log(f"❌ リクエストエラー: {e!r}")
+                except Exception as e:
+                    self.log(f"❌ 不明なエラー: {e}")
 
         self.log("\n--- 全てのURLの解析が完了しました ---")
         self.log("プレビュー:")
-        self.log(json.dumps(self.analysis_results, indent=2, ensure_ascii=False))
+        self.log(orjson.dumps(self.analysis_results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8'))
         
+        self.after(0, self.finish_analysis)
+
+    def finish_analysis(self):
+        """解析完了後にボタンの状態を元に戻す"""
         self.analyze_button.config(state=tk.NORMAL, text="2. 解析実行")
         if self.analysis_results:
             self.save_button.config(state=tk.NORMAL)
 
-    def analyze_html(self, soup):
-        """BeautifulSoupオブジェクトから指定された領域の情報を抽出する"""
-        data = {}
-
-        # --- 領域1: div#ppd (価格、タイトル、箇条書きなど) ---
-        ppd_div = soup.find('div', id='ppd')
-        if ppd_div:
-            self.log("  - div#ppd を解析中...")
-            
-            # 商品タイトル
-            title_tag = ppd_div.find('span', id='productTitle')
-            data['product_title'] = title_tag.text.strip() if title_tag else 'N/A'
-
-            # ブランド
-            byline_tag = ppd_div.find('div', id='bylineInfo_feature_div')
-            data['brand'] = byline_tag.text.strip() if byline_tag else 'N/A'
-            
-            # 価格
-            price_whole = ppd_div.select_one('.a-price-whole')
-            price_fraction = ppd_div.select_one('.a-price-fraction')
-            data['price'] = (price_whole.text.strip() + price_fraction.text.strip()) if price_whole and price_fraction else 'N/A'
-            
-            # 箇条書き (商品の特徴)
-            feature_bullets_ul = ppd_div.find('ul', class_='a-unordered-list a-vertical a-spacing-mini')
-            if feature_bullets_ul:
-                features = [li.text.strip() for li in feature_bullets_ul.find_all('li')]
-                data['feature_bullets'] = features
-
-        # --- 領域2: div.a-column.a-span12.a-span-last (詳細情報テーブル) ---
-        # このクラス名は一般的すぎるため、より具体的なIDやクラスで絞り込む
-        details_div = soup.find('div', id='detailBullets_feature_div') # 新しいレイアウト
-        if not details_div:
-            details_div = soup.find('div', id='productDetails_feature_div') # 古いレイアウト
-        
-        if details_div:
-            self.log("  - 詳細情報セクションを解析中...")
-            details = {}
-            # 新しいレイアウト (箇条書き形式)
-            for li in details_div.select('li'):
-                key_tag = li.select_one('span.a-text-bold')
-                if key_tag:
-                    key = key_tag.text.replace(':', '').replace('\n', '').strip()
-                    value = key_tag.find_next_sibling('span').text.strip() if key_tag.find_next_sibling('span') else ''
-                    details[key] = value
-            data['product_details_list'] = details
-        
-        # 古いレイアウト (テーブル形式)
-        tech_spec_table = soup.find('table', id='productDetails_techSpec_section_1')
-        if tech_spec_table:
-            self.log("  - 技術仕様テーブルを解析中...")
-            tech_specs = {}
-            for tr in tech_spec_table.find_all('tr'):
-                th = tr.find('th')
-                td = tr.find('td')
-                if th and td:
-                    key = th.text.strip()
-                    value = td.text.strip()
-                    tech_specs[key] = re.sub(r'\s+', ' ', value)
-            data['product_details_table'] = tech_specs
-            
-        return data
-
     def save_results(self):
         """解析結果をJSONファイルとして保存する"""
         if not self.analysis_results:
@@ -191,8 +267,9 @@ class AmazonAnalyzerApp(tk.Tk):
         
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.analysis_results, f, indent=4, ensure_ascii=False)
+                # orjsonはUTF-8のbytesを返すため、そのままバイナリで書き込む
+                with open(file_path, 'wb') as f:
+                    f.write(orjson.dumps(self.analysis_results, option=orjson.OPT_INDENT_2))
                 self.log(f"✅ 解析結果を {file_path} に保存しました。")
             except Exception as e:
                 self.log(f"❌ ファイルの保存中にエラーが発生しました: {e}")
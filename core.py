@@ -4,15 +4,25 @@
 import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import socket
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from core_utils import TokenBucket, SQLiteCache, RAKUTEN_EX_RE, col_to_num, num_to_col, retry_after_seconds
+
+# スプレッドシートへ書き込む列の順序 (ヘッダーと対応)
+_PROD_GETTER = operator.itemgetter('name', 'price', 'url', 'shop', 'caption', 'review_avg', 'image_urls')
 
 class RakutenProductFinder:
     """
     JANコードを元に楽天で商品を検索し、Google Sheetsを更新するクラス。
     """
     RAKUTEN_API_URL = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
+    CACHE_FILE = "rakuten_item_cache.sqlite"
+    CACHE_TTL = 86400 # キャッシュの有効期限 (秒)
     
     def __init__(self, config, logger_callback=print):
         """
@@ -23,8 +33,26 @@ class RakutenProductFinder:
         """
         self.config = config
         self.logger = logger_callback
+        # 全ワーカースレッドで共有するAPI呼び出しレートの制御
+        self._api_bucket = TokenBucket(rate=self.config.get("api_qps", 1.0), burst=self.config.get("api_burst", 1))
+        # バッチ間の最小間隔 (処理がこれより長くかかった場合は待機しない)
+        self._batch_bucket = TokenBucket.every(self.config.get("api_delay", 3.0))
+        self._headers_ready = False
+        self._setup_http_session()
+        self._setup_cache()
         self._setup_services()
 
+    def _setup_http_session(self):
+        """接続を再利用するための共有HTTPセッションを作成する"""
+        self.http = requests.Session()
+        self.http.headers.update({"User-Agent": "RakutenProductFinder/1.0"})
+        # コネクションプールをワーカー数に合わせ、一時的なエラーは自動で再試行する
+        # (429はRetry-Afterに従って全ワーカーを止めるため、_call_rakuten_apiで扱う)
+        pool_size = self.config.get("api_workers", 8)
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * 2, max_retries=retry)
+        self.http.mount("https://", adapter)
+
     def _setup_services(self):
         """APIキーや認証情報を用いて各種サービスを初期化する"""
         self.logger("🔧 サービスを初期化中...")
@@ -49,15 +77,25 @@ class RakutenProductFinder:
             self.logger(f"❌ Google Sheetsの認証または接続に失敗しました: {e}")
             raise
 
-    def _column_letter_to_number(self, column_letter):
-        """アルファベットの列文字を数値に変換 (A=1, B=2, ...)"""
-        num = 0
-        for char in column_letter.upper():
-            num = num * 26 + (ord(char) - ord('A') + 1)
-        return num
+    def _setup_cache(self):
+        """JANコードごとの検索結果を保存するディスクキャッシュを初期化する"""
+        self._cache = SQLiteCache(
+            self.config.get("cache_path", self.CACHE_FILE),
+            ttl=self.config.get("cache_ttl", self.CACHE_TTL),
+            enabled=self.config.get("use_cache", True),
+            threadsafe=True,
+            logger=self.logger,
+        )
 
     def _call_rakuten_api(self, jan_code):
         """指定されたJANコードで楽天商品検索APIを呼び出す"""
+        cached = self._cache.get(jan_code)
+        if cached is not None:
+            self.logger(f"💾 JAN [{jan_code}] はキャッシュから取得しました。")
+            return cached
+
+        self._api_bucket.consume()
+        self.logger(f"🔍 JAN [{jan_code}] を検索中...")
         params = {
             "applicationId": self.config["rakuten_app_id"],
             "affiliateId": self.config.get("rakuten_affiliate_id", ""),
@@ -66,27 +104,32 @@ class RakutenProductFinder:
             "hits": 1
         }
         try:
-            response = requests.get(self.RAKUTEN_API_URL, params=params, timeout=30)
+            for attempt in range(2):
+                response = self.http.get(self.RAKUTEN_API_URL, params=params, timeout=30)
+                if response.status_code == 429 and attempt == 0:
+                    # 呼び出し制限に達した場合は、全ワーカーの呼び出しを指定時間止めてから1回だけ再試行する
+                    wait = retry_after_seconds(response.headers.get("Retry-After"))
+                    self._api_bucket.pause(wait)
+                    self.logger(f"⏳ APIの呼び出し制限に達しました。{wait}秒間呼び出しを控えます (JAN: {jan_code})")
+                    self._api_bucket.consume()
+                    continue
+                break
             response.raise_for_status()
             data = response.json()
 
             if data.get("Items"):
                 item = data["Items"][0]
                 
-                image_urls_list = []
-                for img_data in item.get("mediumImageUrls", []):
-                    url = ""
-                    if isinstance(img_data, dict):
-                        url = img_data.get("imageUrl")
-                    elif isinstance(img_data, str):
-                        url = img_data
-                    
-                    if url:
-                        image_urls_list.append(url.replace('?_ex=128x128', ''))
+                # 画像データはdict形式と文字列形式の両方があり得る
+                raw_urls = (
+                    img_data.get("imageUrl") if isinstance(img_data, dict) else img_data
+                    for img_data in item.get("mediumImageUrls", [])
+                )
+                image_urls_list = [RAKUTEN_EX_RE.sub('', url) for url in raw_urls if url and isinstance(url, str)]
                 
                 image_urls_str = "\n".join(image_urls_list) if image_urls_list else "情報なし"
 
-                return {
+                product_info = {
                     "name": item.get("itemName", "情報なし"),
                     "price": item.get("itemPrice", "情報なし"),
                     "url": item.get("itemUrl", "情報なし"),
@@ -95,10 +138,21 @@ class RakutenProductFinder:
                     "review_avg": item.get("reviewAverage", "情報なし"),
                     "image_urls": image_urls_str
                 }
+                self._cache.set(jan_code, product_info)
+                return product_info
             else:
                 self.logger(f"ℹ️ JAN [{jan_code}] の商品は見つかりませんでした。")
                 return None
 
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                # 再試行しても制限が解除されなかった場合は、全ワーカーの呼び出しを指定時間止める
+                wait = retry_after_seconds(e.response.headers.get("Retry-After"))
+                self._api_bucket.pause(wait)
+                self.logger(f"⏳ APIの呼び出し制限に達しました。{wait}秒間呼び出しを控えます (JAN: {jan_code})")
+            else:
+                self.logger(f"❌ APIリクエストエラー (JAN: {jan_code}): {e}")
+            return None
         except requests.exceptions.RequestException as e:
             self.logger(f"❌ APIリクエストエラー (JAN: {jan_code}): {e}")
             return None
@@ -109,21 +163,31 @@ class RakutenProductFinder:
     # --- ▼ヘッダーを自動で確認・作成する機能を追加▼ ---
     def _check_and_create_headers(self):
         """出力列のヘッダーを確認し、なければ作成する"""
+        if self._headers_ready:
+            return
         try:
             self.logger("🔍 ヘッダーの確認...")
             header_row = 1 # ヘッダーは1行目と仮定
             start_col = self.config['output_start_col_letter']
             
-            # ヘッダーの最初のセルの値を取得
-            first_header_cell_value = self.sheet.cell(header_row, self._column_letter_to_number(start_col)).value
-            
             expected_headers = [
                 "商品名", "価格", "URL", "店舗名", 
                 "商品説明文", "レビュー平均点", "画像URL"
             ]
+            end_col = num_to_col(col_to_num(start_col) + len(expected_headers) - 1)
 
-            # 最初のヘッダーが期待通りでない場合、ヘッダー行全体を更新
-            if first_header_cell_value != expected_headers[0]:
+            # ヘッダー行の出力範囲を1回のリクエストでまとめて取得
+            header_range = f"{self.sheet.title}!{start_col}{header_row}:{end_col}{header_row}"
+            response = self.sheets_service.spreadsheets().values().batchGet(
+                spreadsheetId=self.config["spreadsheet_id"],
+                ranges=[header_range]
+            ).execute()
+            value_ranges = response.get('valueRanges', [])
+            header_values = value_ranges[0].get('values', []) if value_ranges else []
+            current_headers = header_values[0] if header_values else []
+
+            # ヘッダーが期待通りでない場合、ヘッダー行全体を更新
+            if current_headers != expected_headers:
                 self.logger("ℹ️ ヘッダーを作成または更新します...")
                 
                 range_to_update = f"{start_col}{header_row}"
@@ -132,8 +196,9 @@ class RakutenProductFinder:
                 self.logger("✅ ヘッダーの作成/更新が完了しました。")
             else:
                 self.logger("✅ ヘッダーは既に存在します。")
+            self._headers_ready = True
 
-        except gspread.exceptions.APIError as e:
+        except (gspread.exceptions.APIError, HttpError) as e:
             self.logger(f"❌ Google Sheets APIエラー: ヘッダーの確認中に問題が発生しました。詳細: {e}")
             raise
         except Exception as e:
@@ -159,7 +224,7 @@ class RakutenProductFinder:
             
             batch_data = []
             jan_col_index = 0
-            output_col_index = self._column_letter_to_number(output_col_letter) - self._column_letter_to_number(jan_col_letter)
+            output_col_index = col_to_num(output_col_letter) - col_to_num(jan_col_letter)
 
             for i, row_values in enumerate(values):
                 jan_code = row_values[jan_col_index] if len(row_values) > jan_col_index else ""
@@ -189,18 +254,9 @@ class RakutenProductFinder:
             output_col = self.config['output_start_col_letter']
             data_to_write = []
             for item in update_data:
-                row_values = [
-                    item['product_info']['name'],
-                    item['product_info']['price'],
-                    item['product_info']['url'],
-                    item['product_info']['shop'],
-                    item['product_info']['caption'],
-                    item['product_info']['review_avg'],
-                    item['product_info']['image_urls']
-                ]
                 data_to_write.append({
                     'range': f"{self.sheet.title}!{output_col}{item['row']}",
-                    'values': [row_values]
+                    'values': [list(_PROD_GETTER(item['product_info']))]
                 })
             
             body = {'valueInputOption': 'USER_ENTERED', 'data': data_to_write}
@@ -239,26 +295,30 @@ class RakutenProductFinder:
                 continue
             
             consecutive_empty_batches = 0
+            self._batch_bucket.consume()
             
-            update_data = []
+            # 同じJANコードが複数行にある場合もAPIは1回だけ呼び出し、結果を全行に反映する
+            rows_by_jan = {}
             for item in batch_data:
-                self.logger(f"🔍 JAN [{item['jan']}] を検索中...")
-                product_info = self._call_rakuten_api(item['jan'])
-                
+                rows_by_jan.setdefault(item['jan'], []).append(item['row'])
+
+            # API呼び出しはI/O待ちが支配的なため、スレッドプールで並行実行する
+            with ThreadPoolExecutor(max_workers=self.config.get("api_workers", 8)) as executor:
+                results = list(executor.map(self._call_rakuten_api, rows_by_jan))
+
+            update_data = []
+            for (jan_code, rows), product_info in zip(rows_by_jan.items(), results):
                 if product_info:
-                    update_data.append({
-                        'row': item['row'],
-                        'product_info': product_info
-                    })
-                    self.logger(f"  => 取得成功: {str(product_info['name'])[:30]}...")
-                
-                time.sleep(1)
+                    for row in rows:
+                        update_data.append({
+                            'row': row,
+                            'product_info': product_info
+                        })
+                    self.logger(f"  => 取得成功 (JAN: {jan_code}, {len(rows)}行): {str(product_info['name'])[:30]}...")
 
             if update_data:
                 self._batch_update_sheets(update_data)
             
             current_row += self.config["batch_size"]
-            self.logger(f"⏳ 次のバッチまで{self.config['api_delay']}秒待機...")
-            time.sleep(self.config["api_delay"])
             
         self.logger("\n🎉 全処理完了！ 🎉")
@@ -0,0 +1,160 @@
+# core_utils.py
+# 各コアロジックで共通して使う補助関数とレート制御
+
+import time
+import threading
+import asyncio
+import functools
+import contextlib
+import re
+import sqlite3
+import json
+
+# 楽天の画像URL末尾のサムネイル指定 (?_ex=128x128 など、サイズを問わず) を取り除くための正規表現
+RAKUTEN_EX_RE = re.compile(r'\?_ex=\d+x\d+$')
+
+@functools.lru_cache(maxsize=64)
+def col_to_num(column_letter):
+    """アルファベットの列文字を数値に変換 (A=1, B=2, ...)"""
+    letters = column_letter.upper()
+    # 実際の列指定はほぼ1～2文字なので、ループを使わずに直接計算する
+    if len(letters) == 1:
+        return ord(letters) - 64
+    if len(letters) == 2:
+        return (ord(letters[0]) - 64) * 26 + (ord(letters[1]) - 64)
+    num = 0
+    for char in letters:
+        num = num * 26 + (ord(char) - 64)
+    return num
+
+@functools.lru_cache(maxsize=64)
+def num_to_col(column_number):
+    """数値を列文字に変換 (1=A, 2=B, ...)"""
+    letters = ""
+    while column_number > 0:
+        column_number, remainder = divmod(column_number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def retry_after_seconds(value, default=1.0):
+    """Retry-Afterヘッダーの値を秒数に変換する (日付形式など解釈できない場合は既定値)"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット。
+    トークンが残っている間は待たずに通し、枯渇したときだけ補充に必要な時間だけ待機させる。
+    トークンは実際に使える時点で取得するため、待機中に pause() された場合はその分だけ長く待つ。
+    """
+    # 間隔が0以下の設定を「待機なし」として扱う際の下限 (秒)
+    MIN_INTERVAL = 0.001
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: 1秒あたりに補充されるトークン数 (許容するリクエスト数/秒)
+        :param burst: 溜めておけるトークンの最大数
+        """
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def every(cls, interval, burst=1):
+        """interval秒ごとに1トークンを補充するバケットを作る (0以下の間隔は待機なしとして扱う)"""
+        return cls(rate=1.0 / max(interval, cls.MIN_INTERVAL), burst=burst)
+
+    def _refill(self):
+        """経過時間に応じてトークンを補充する (ロック取得済みで呼び出す)"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _try_take(self):
+        """トークンがあれば1つ消費して0を返し、なければ次のトークンまでの待機秒数を返す"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def available(self):
+        """現在すぐに使えるトークン数を返す"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def consume(self):
+        """トークンを1つ消費する。枯渇している場合のみ補充されるまで待機する"""
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire(self):
+        """consume() の非同期版。待機中もイベントループを止めない"""
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """サーバーから待機を指示された場合に、指定秒数ぶんトークンの補充を遅らせる"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+class SQLiteCache:
+    """
+    キーごとの結果をJSONで保存する、有効期限付きのSQLiteキャッシュ。
+    無効に設定された場合や開けなかった場合は、常に未ヒットとして振る舞う。
+    """
+    def __init__(self, path, ttl, enabled=True, threadsafe=False, logger=print):
+        """
+        :param path: キャッシュファイルのパス
+        :param ttl: 有効期限 (秒)
+        :param enabled: Falseの場合はキャッシュを使わない
+        :param threadsafe: 複数スレッドから使う場合はTrue (接続をロックで保護する)
+        :param logger: ログ出力用のコールバック関数
+        """
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock() if threadsafe else contextlib.nullcontext()
+        if not enabled:
+            logger("ℹ️ キャッシュは無効に設定されています。")
+            return
+        try:
+            self._conn = sqlite3.connect(path, check_same_thread=not threadsafe)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, ts REAL, payload TEXT)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger(f"⚠️ キャッシュを開けなかったため、キャッシュなしで続行します: {e}")
+            self._conn = None
+
+    def get(self, key):
+        """有効期限内のキャッシュがあれば返す"""
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT ts, payload FROM cache WHERE key = ?", (key,)).fetchone()
+        if row and time.time() - row[0] < self.ttl:
+            return json.loads(row[1])
+        return None
+
+    def set(self, key, value):
+        """結果をキャッシュに保存する"""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, ts, payload) VALUES (?, ?, ?)",
+                (key, time.time(), json.dumps(value, ensure_ascii=False))
+            )
+            self._conn.commit()
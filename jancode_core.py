@@ -5,10 +5,12 @@ import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 import requests
+import asyncio
+import aiohttp
 from bs4 import BeautifulSoup
-import time
 import socket
 from urllib.parse import urljoin
+from core_utils import TokenBucket, SQLiteCache, col_to_num, num_to_col, retry_after_seconds
 
 class JanCodeScraper:
     """
@@ -16,6 +18,11 @@ class JanCodeScraper:
     """
     BASE_URL = "https://www.jancode.xyz/"
     SEARCH_URL = "https://www.jancode.xyz/code/"
+    CACHE_FILE = "jancode_cache.sqlite"
+    CACHE_TTL = 86400 # キャッシュの有効期限 (秒)
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    }
     
     def __init__(self, config, logger_callback=print):
         """
@@ -24,9 +31,15 @@ class JanCodeScraper:
         self.config = config
         self.logger = logger_callback
         self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        })
+        self.session.headers.update(self.HEADERS)
+        self._headers_ready = False
+        # 一括検索・詳細ページとも設定されたリクエスト間隔でレートを制御する
+        # (詳細ページは同時接続数ぶんのバーストのみ許容する)
+        delay = self.config.get("delay", 3)
+        max_concurrency = self.config.get("max_concurrency", 4)
+        self._search_bucket = TokenBucket.every(delay)
+        self._detail_bucket = TokenBucket.every(delay, burst=max_concurrency)
+        self._setup_cache()
         self._setup_gsheets()
 
     def _setup_gsheets(self):
@@ -47,12 +60,14 @@ class JanCodeScraper:
             self.logger(f"❌ Google Sheetsの認証に失敗しました: {e}")
             raise
 
-    def _column_letter_to_number(self, column_letter):
-        """アルファベットの列文字を数値に変換"""
-        num = 0
-        for char in column_letter.upper():
-            num = num * 26 + (ord(char) - ord('A') + 1)
-        return num
+    def _setup_cache(self):
+        """詳細ページURLごとの解析結果を保存するディスクキャッシュを初期化する"""
+        self._cache = SQLiteCache(
+            self.config.get("cache_path", self.CACHE_FILE),
+            ttl=self.config.get("cache_ttl", self.CACHE_TTL),
+            enabled=self.config.get("use_cache", True),
+            logger=self.logger,
+        )
 
     def _get_detail_page_urls(self, jan_codes):
         """一括検索を行い、詳細ページのURLリストを取得する"""
@@ -63,9 +78,16 @@ class JanCodeScraper:
             "process": "code_multi"
         }
         try:
+            self._search_bucket.consume()
             response = self.session.post(self.SEARCH_URL, data=payload, timeout=60)
+            if response.status_code == 429:
+                wait = retry_after_seconds(response.headers.get("Retry-After"), self.config.get("delay", 3))
+                self.logger(f"⏳ アクセス制限を受けたため、{wait}秒待機して再試行します...")
+                self._search_bucket.pause(wait)
+                self._search_bucket.consume()
+                response = self.session.post(self.SEARCH_URL, data=payload, timeout=60)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(response.text, 'lxml')
             
             urls = []
             for a_tag in soup.select(".result-box-out > a"):
@@ -80,58 +102,98 @@ class JanCodeScraper:
             self.logger(f"❌ 一括検索リクエスト中にエラーが発生しました: {e}")
             return []
 
-    def _scrape_detail_page(self, url):
-        """詳細ページから全情報を抽出する"""
+    async def _scrape_detail_pages(self, urls):
+        """詳細ページを同時接続数を制限しながら並行取得・解析する"""
+        max_concurrency = self.config.get("max_concurrency", 4)
+        sem = asyncio.Semaphore(max_concurrency)
+        connector = aiohttp.TCPConnector(limit_per_host=max_concurrency)
+        async with aiohttp.ClientSession(headers=self.HEADERS, connector=connector) as session:
+            return await asyncio.gather(*[self._scrape_detail_page(session, sem, url) for url in urls])
+
+    async def _scrape_detail_page(self, session, sem, url):
+        """詳細ページを取得し、全情報を抽出する"""
+        cached = self._cache.get(url)
+        if cached is not None:
+            self.logger(f"💾 キャッシュから取得: {url}")
+            return cached
+
         try:
-            response = self.session.get(url, timeout=60)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            info = {}
-            table = soup.find('table', class_='table-block')
-            if not table:
-                return None
-
-            for row in table.find_all('tr'):
-                th = row.find('th')
-                td = row.find('td')
-                if th and td:
-                    key = th.text.strip()
-                    # --- ▼キー名をヘッダーと統一▼ ---
-                    if key == "商品イメージ":
-                        img_tag = td.find('img')
-                        info["商品イメージURL"] = urljoin(self.BASE_URL, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ''
-                    elif key == "価格調査":
-                        links = {a.find('img')['src'].split('/')[-1].split('.')[0]: a['href'] for a in td.select('a') if a.find('img')}
-                        info["楽天URL"] = links.get('rakuten', '')
-                        info["YahooURL"] = links.get('yahoo', '')
-                        info["AmazonURL"] = links.get('amazon', '')
-                    elif key == "JANシンボル":
-                        img_tag = td.find('img')
-                        info["JANシンボル画像URL"] = urljoin(self.BASE_URL, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ''
-                    # --- ▲ここまで修正▲ ---
-                    elif key == "商品ジャンル":
-                        info[key] = " > ".join([a.text.strip() for a in td.find_all('a')])
-                    else:
-                        info[key] = td.text.strip()
-            
-            info["詳細ページURL"] = url
-            return info
-        except requests.exceptions.RequestException as e:
+            for attempt in range(2):
+                await self._detail_bucket.acquire()
+                async with sem:
+                    self.logger(f"📄 詳細ページをスクレイピング中: {url}")
+                    async with session.get(url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                        if response.status == 429 and attempt == 0:
+                            # サーバーから待機を指示された場合のみ、全リクエストの送信を遅らせて1回だけ再試行する
+                            self._detail_bucket.pause(retry_after_seconds(response.headers.get("Retry-After"), self.config.get("delay", 3)))
+                            continue
+                        response.raise_for_status()
+                        # 文字コードの判定はlxmlに任せるため、デコードせずにバイト列のまま渡す
+                        html = await response.read()
+                break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger(f"❌ 詳細ページ取得エラー ({url}): {e!r}")
+            return None
+        except Exception as e:
+            # 1ページの想定外のエラーでバッチ全体が止まらないよう、このページだけを諦める
             self.logger(f"❌ 詳細ページ取得エラー ({url}): {e}")
             return None
+
+        try:
+            info = self._parse_detail_html(html, url)
         except Exception as e:
             self.logger(f"❌ 詳細ページ解析エラー ({url}): {e}")
             return None
 
+        if info:
+            self._cache.set(url, info)
+        return info
+
+    def _parse_detail_html(self, html, url):
+        """詳細ページのHTMLから全情報を抽出する"""
+        soup = BeautifulSoup(html, 'lxml')
+        
+        info = {}
+        table = soup.find('table', class_='table-block')
+        if not table:
+            return None
+
+        for row in table.find_all('tr'):
+            th = row.find('th')
+            td = row.find('td')
+            if th and td:
+                key = th.text.strip()
+                # --- ▼キー名をヘッダーと統一▼ ---
+                if key == "商品イメージ":
+                    img_tag = td.find('img')
+                    info["商品イメージURL"] = urljoin(self.BASE_URL, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ''
+                elif key == "価格調査":
+                    links = {a.find('img')['src'].split('/')[-1].split('.')[0]: a['href'] for a in td.select('a') if a.find('img')}
+                    info["楽天URL"] = links.get('rakuten', '')
+                    info["YahooURL"] = links.get('yahoo', '')
+                    info["AmazonURL"] = links.get('amazon', '')
+                elif key == "JANシンボル":
+                    img_tag = td.find('img')
+                    info["JANシンボル画像URL"] = urljoin(self.BASE_URL, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ''
+                # --- ▲ここまで修正▲ ---
+                elif key == "商品ジャンル":
+                    info[key] = " > ".join([a.text.strip() for a in td.find_all('a')])
+                else:
+                    info[key] = td.text.strip()
+        
+        info["詳細ページURL"] = url
+        return info
+
     def _check_and_create_headers(self):
         """出力列のヘッダーを確認し、なければ作成する"""
+        if self._headers_ready:
+            return
         self.logger("🔍 ヘッダーの確認...")
         try:
             # --- ▼ここから修正▼ ---
             # GUIで指定された出力開始列を取得
             start_col_letter = self.config['output_start_col_letter'].upper()
-            start_col_num = self._column_letter_to_number(start_col_letter)
+            start_col_num = col_to_num(start_col_letter)
 
             # ヘッダーとして期待される値のリスト（出力列のみ）
             expected_headers = [
@@ -140,16 +202,16 @@ class JanCodeScraper:
                 "AmazonURL", "詳細ページURL"
             ]
             
-            # スプレッドシートの1行目全体の値を取得
-            current_headers_all = self.sheet.row_values(1)
-            
-            # 必要な長さに足りない場合は空文字で埋める
-            if len(current_headers_all) < start_col_num + len(expected_headers):
-                padding_needed = (start_col_num + len(expected_headers)) - len(current_headers_all)
-                current_headers_all.extend([""] * padding_needed)
-            
-            # 実際のヘッダー部分をスライスで取得
-            actual_headers_slice = current_headers_all[start_col_num - 1 : start_col_num - 1 + len(expected_headers)]
+            # 1行目のうち出力列の範囲だけを1回のリクエストで取得
+            end_col_letter = num_to_col(start_col_num + len(expected_headers) - 1)
+            header_range = f"{self.sheet.title}!{start_col_letter}1:{end_col_letter}1"
+            response = self.sheets_service.spreadsheets().values().batchGet(
+                spreadsheetId=self.config["spreadsheet_id"],
+                ranges=[header_range]
+            ).execute()
+            value_ranges = response.get('valueRanges', [])
+            header_values = value_ranges[0].get('values', []) if value_ranges else []
+            actual_headers_slice = header_values[0] if header_values else []
 
             # ヘッダーが期待通りか比較
             if actual_headers_slice != expected_headers:
@@ -162,12 +224,34 @@ class JanCodeScraper:
                 self.logger("✅ ヘッダーの作成/更新が完了しました。")
             else:
                 self.logger("✅ ヘッダーは既に存在します。")
+            self._headers_ready = True
             # --- ▲ここまで修正▲ ---
 
         except Exception as e:
             self.logger(f"⚠️ ヘッダーの確認・作成中にエラーが発生しました: {e}")
             raise
 
+    def _merge_contiguous_rows(self, rows_to_write):
+        """連続する行をまとめ、1つの矩形範囲ごとの書き込みデータに変換する"""
+        runs = []
+        for row, values in sorted(rows_to_write, key=lambda r: r[0]):
+            if runs and row == runs[-1][1] + 1:
+                runs[-1][1] = row
+                runs[-1][2].append(values)
+            else:
+                runs.append([row, row, [values]])
+
+        start_col_letter = self.config['output_start_col_letter'].upper()
+        start_col_num = col_to_num(start_col_letter)
+        data_to_write = []
+        for first_row, last_row, values in runs:
+            end_col_letter = num_to_col(start_col_num + len(values[0]) - 1)
+            data_to_write.append({
+                "range": f"{self.sheet.title}!{start_col_letter}{first_row}:{end_col_letter}{last_row}",
+                "values": values
+            })
+        return data_to_write
+
     def run_process(self):
         """メインの処理ループを実行する"""
         try:
@@ -183,9 +267,18 @@ class JanCodeScraper:
         while True:
             self.logger(f"\n--- {current_row}行目からのバッチ処理を開始 ---")
             try:
-                jan_col_num = self._column_letter_to_number(self.config["jan_col_letter"])
-                jan_codes_raw = self.sheet.col_values(jan_col_num)[current_row - 1 : current_row - 1 + batch_size]
-                jan_codes_to_process = [code for code in jan_codes_raw if code.strip()]
+                # 列全体ではなく、このバッチの範囲だけを列方向の1次元配列として取得する
+                jan_col_letter = self.config["jan_col_letter"]
+                range_to_get = f"{self.sheet.title}!{jan_col_letter}{current_row}:{jan_col_letter}{current_row + batch_size - 1}"
+                response = self.sheets_service.spreadsheets().values().get(
+                    spreadsheetId=self.config["spreadsheet_id"],
+                    range=range_to_get,
+                    majorDimension="COLUMNS"
+                ).execute()
+                columns = response.get('values', [])
+                jan_codes_raw = columns[0] if columns else []
+                # 重複するJANコードは1回だけ検索する (書き込み時に該当する全行へ反映される)
+                jan_codes_to_process = list(dict.fromkeys(code for code in jan_codes_raw if code.strip()))
             except Exception as e:
                 self.logger(f"❌ スプレッドシートからのデータ取得に失敗しました: {e}")
                 break
@@ -195,23 +288,20 @@ class JanCodeScraper:
                 break
 
             detail_urls = self._get_detail_page_urls(jan_codes_to_process)
-            time.sleep(self.config.get("delay", 3))
 
             if not detail_urls:
-                current_row += len(jan_codes_raw) if jan_codes_raw else batch_size
+                current_row += batch_size
                 continue
 
+            # 詳細ページは設定された間隔を平均で守りつつ、同時接続数の上限内で並行取得する
             all_scraped_data = {}
-            for url in detail_urls:
-                self.logger(f"📄 詳細ページをスクレイピング中: {url}")
-                scraped_info = self._scrape_detail_page(url)
+            for scraped_info in asyncio.run(self._scrape_detail_pages(detail_urls)):
                 if scraped_info and "コード番号" in scraped_info:
                     all_scraped_data[scraped_info["コード番号"]] = scraped_info
-                time.sleep(self.config.get("delay", 3))
 
             if all_scraped_data:
                 self.logger(f"📝 {len(all_scraped_data)}件のデータをスプレッドシートに書き込みます...")
-                update_requests = []
+                rows_to_write = []
                 
                 for i, jan_in_sheet in enumerate(jan_codes_raw):
                     if jan_in_sheet in all_scraped_data:
@@ -226,13 +316,17 @@ class JanCodeScraper:
                             data.get("詳細ページURL", "")
                         ]
                         # --- ▲ここまで修正▲ ---
-                        range_str = f"{self.config['output_start_col_letter']}{row_to_write}"
-                        update_requests.append({"range": range_str, "values": [values]})
+                        rows_to_write.append((row_to_write, values))
                 
-                if update_requests:
-                    self.sheet.batch_update(update_requests, value_input_option='USER_ENTERED')
-                    self.logger("✅ 書き込み完了。")
+                if rows_to_write:
+                    # 連続する行は1つの範囲にまとめ、送信する範囲の数を減らす
+                    update_requests = self._merge_contiguous_rows(rows_to_write)
+                    body = {'valueInputOption': 'USER_ENTERED', 'data': update_requests}
+                    self.sheets_service.spreadsheets().values().batchUpdate(
+                        spreadsheetId=self.config["spreadsheet_id"], body=body
+                    ).execute()
+                    self.logger(f"✅ 書き込み完了。({len(rows_to_write)}行 / {len(update_requests)}範囲)")
 
-            current_row += len(jan_codes_raw) if jan_codes_raw else batch_size
+            current_row += batch_size
         
         self.logger("\n🎉 全処理完了！ 🎉")
@@ -4,6 +4,7 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext
 import threading
+import queue
 import os
 import json
 
@@ -16,6 +17,8 @@ except ImportError:
 
 class App(tk.Tk):
     CONFIG_FILE = "jancode_config.json"
+    LOG_DRAIN_INTERVAL_MS = 50
+    MAX_LOG_LINES = 2000
 
     def __init__(self):
         super().__init__()
@@ -32,10 +35,14 @@ class App(tk.Tk):
             "start_row": tk.IntVar(value=2),
             "batch_size": tk.IntVar(value=100),
             "delay": tk.DoubleVar(value=3.0),
+            "use_cache": tk.BooleanVar(value=True),
         }
 
+        self._log_q = queue.Queue()
+
         self.create_widgets()
         self.load_config()
+        self.after(self.LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -83,6 +90,9 @@ class App(tk.Tk):
         ttk.Label(settings_frame, text="リクエスト間隔(秒):").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
         ttk.Entry(delay_frame, textvariable=self.config_vars["delay"], width=5).pack(side=tk.LEFT)
 
+        # キャッシュ設定
+        ttk.Checkbutton(settings_frame, text="詳細ページのキャッシュを使用する (24時間)", variable=self.config_vars["use_cache"]).grid(row=6, column=1, sticky=tk.W, pady=5)
+
         settings_frame.columnconfigure(1, weight=1)
 
         self.run_button = ttk.Button(main_frame, text="処理実行", command=self.start_process)
@@ -102,10 +112,20 @@ class App(tk.Tk):
             self.config_vars["json_path"].set(file_path)
 
     def log(self, message):
-        if self.log_area:
-            self.log_area.insert(tk.END, message + '\n')
+        self._log_q.put(message)
+
+    def _drain_log_queue(self):
+        messages = []
+        while not self._log_q.empty():
+            messages.append(self._log_q.get_nowait())
+        if messages:
+            self.log_area.insert(tk.END, "\n".join(messages) + "\n")
+            # 古い行を先頭から削除して行数を上限内に保つ
+            line_count = int(self.log_area.index("end-1c").split(".")[0])
+            if line_count > self.MAX_LOG_LINES:
+                self.log_area.delete("1.0", f"{line_count - self.MAX_LOG_LINES}.0")
             self.log_area.see(tk.END)
-            self.update_idletasks()
+        self.after(self.LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
 
     def load_config(self):
         if os.path.exists(self.CONFIG_FILE):
@@ -160,7 +180,8 @@ class App(tk.Tk):
         except Exception as e:
             self.log(f"\nCRITICAL ERROR: 予期せぬエラーが発生しました。\n{e}")
         finally:
-            self.run_button.config(state=tk.NORMAL, text="処理実行")
+            # Tkの操作はメインスレッドに任せる
+            self.after(0, lambda: self.run_button.config(state=tk.NORMAL, text="処理実行"))
 
 if __name__ == "__main__":
     app = App()
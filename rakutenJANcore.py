@@ -4,9 +4,53 @@
 import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-import requests
-import time
-import socket
+from googleapiclient.errors import HttpError
+import asyncio
+import aiohttp
+import threading
+import queue
+import operator
+from core_utils import TokenBucket, SQLiteCache, RAKUTEN_EX_RE, col_to_num, num_to_col, retry_after_seconds
+
+# orjsonがあれば高速なデコーダを使い、なければ標準ライブラリにフォールバックする
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+# ISBN/JANの比較用にハイフンを取り除く変換テーブル
+_DASH_TBL = str.maketrans("", "", "-")
+
+# APIレスポンスから取り出す項目の定義 (出力キー, 取得元キー, 既定値)
+# 取得元キーがNoneの項目は既定値をそのまま使う
+EXTRACT_BOOKS = (
+    ("type", None, "書籍"),
+    ("name", "title", "情報なし"),
+    ("price", "itemPrice", "情報なし"),
+    ("url", "itemUrl", "情報なし"),
+    ("detail", "author", "情報なし"), # 著者
+    ("caption", "itemCaption", "情報なし"),
+    ("review_avg", "reviewAverage", "情報なし"),
+    ("image_url", "largeImageUrl", "情報なし"),
+)
+# 商品APIの画像URLはリスト形式のため、取り出し後に個別に設定する
+EXTRACT_PRODUCT = (
+    ("type", None, "商品"),
+    ("name", "itemName", "情報なし"),
+    ("price", "itemPrice", "情報なし"),
+    ("url", "itemUrl", "情報なし"),
+    ("detail", "shopName", "情報なし"), # 店舗名
+    ("caption", "itemCaption", "情報なし"),
+    ("review_avg", "reviewAverage", "情報なし"),
+)
+# スプレッドシートへ書き込む列の順序 (ヘッダーと対応)
+_OUTPUT_GETTER = operator.itemgetter(*(key for key, _, _ in EXTRACT_BOOKS))
+
+# (認証JSONのパス, スプレッドシートID) ごとの読み取り用/書き込み用Sheetsサービスとスプレッドシート
+# GUIから繰り返し実行した際に、認証とディスカバリー文書の読み込みを使い回す
+_SERVICE_CACHE = {}
 
 class RakutenBooksFinder:
     """
@@ -16,6 +60,16 @@ class RakutenBooksFinder:
     # APIエンドポイントを両方定義
     RAKUTEN_BOOKS_API_URL = "https://app.rakuten.co.jp/services/api/BooksBook/Search/20170404"
     RAKUTEN_PRODUCT_API_URL = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
+    # ヘッダーを汎用的なものに変更
+    OUTPUT_HEADERS = [
+        "種別", "名称", "価格", "URL", "詳細(著者/店舗)", 
+        "商品説明", "レビュー平均", "画像URL"
+    ]
+    CACHE_FILE = "rakuten_books_cache.sqlite"
+    CACHE_TTL = 7 * 86400 # キャッシュの有効期限 (秒)
+    HTTP_TIMEOUT = (5, 30) # 楽天APIの (接続, 読み込み) タイムアウト (秒)
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    MAX_RETRIES = 3
     
     def __init__(self, config, logger_callback=print):
         """
@@ -23,22 +77,67 @@ class RakutenBooksFinder:
         """
         self.config = config
         self.logger = logger_callback
+        # 全リクエストで共有する楽天API呼び出しレートの制御
+        self._api_bucket = TokenBucket(rate=self.config.get("api_qps", 1.0), burst=self.config.get("api_burst", 2))
+        # バッチ間の最小間隔 (処理がこれより長くかかった場合は待機しない)
+        self._batch_bucket = TokenBucket.every(self.config.get("api_delay", 3.0))
+        self._setup_cache()
         self._setup_services()
 
+    def _setup_cache(self):
+        """APIの検索結果を保存するSQLiteキャッシュを初期化する"""
+        self._cache = SQLiteCache(
+            self.config.get("cache_path", self.CACHE_FILE),
+            ttl=self.config.get("cache_ttl", self.CACHE_TTL),
+            enabled=self.config.get("use_cache", True),
+            threadsafe=True,
+            logger=self.logger,
+        )
+
+    async def _cached(self, endpoint, jan_code, fetcher):
+        """(エンドポイント, JAN) をキーにキャッシュを参照し、なければfetcherで取得して保存する"""
+        key = f"{endpoint}:{jan_code}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.logger(f"  💾 キャッシュから取得しました ({endpoint}, JAN/ISBN: {jan_code})")
+            return cached
+
+        result = await fetcher()
+        # 見つからなかった場合やエラー時は次回再取得できるよう保存しない
+        if result:
+            self._cache.set(key, result)
+        return result
+
     def _setup_services(self):
         """APIキーや認証情報を用いて各種サービスを初期化する"""
         self.logger("🔧 サービスを初期化中...")
-        socket.setdefaulttimeout(self.config.get("timeout", 120))
+        # 出力列の番号は設定のみに依存するため、ここで一度だけ計算しておく (0始まり)
+        self._out_idx = col_to_num(self.config['output_start_col_letter']) - 1
         try:
-            scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-            creds = Credentials.from_service_account_file(
-                self.config["json_path"], scopes=scopes
-            )
-            self.sheets_service = build("sheets", "v4", credentials=creds, cache_discovery=False)
-            gc = gspread.authorize(creds)
-            spreadsheet = gc.open_by_key(self.config["spreadsheet_id"])
+            cache_key = (self.config["json_path"], self.config["spreadsheet_id"])
+            services = _SERVICE_CACHE.get(cache_key)
+            if services is None:
+                scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+                creds = Credentials.from_service_account_file(
+                    self.config["json_path"], scopes=scopes
+                )
+                sheets_service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+                # サービスが内部で使うhttplib2.Httpはスレッドセーフではないため、
+                # 書き込みスレッドには別の接続を持つサービスを用意する
+                writer_service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+                gc = gspread.authorize(creds)
+                spreadsheet = gc.open_by_key(self.config["spreadsheet_id"])
+                services = _SERVICE_CACHE[cache_key] = (sheets_service, writer_service, spreadsheet)
+            else:
+                self.logger("ℹ️ 前回の認証情報とSheetsサービスを再利用します。")
+            self.sheets_service, self._writer_service, spreadsheet = services
             self.sheet = spreadsheet.worksheet(self.config["sheet_name"])
             self.logger("✅ Google Sheets サービス初期化完了")
+
+            # Sheetsへの書き込みは専用スレッドで行い、API検索と並行させる
+            self._write_q = queue.Queue(maxsize=4)
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
         except gspread.exceptions.WorksheetNotFound:
             self.logger(f"❌ ワークシートが見つかりません: '{self.config['sheet_name']}'。")
             raise
@@ -46,16 +145,33 @@ class RakutenBooksFinder:
             self.logger(f"❌ Google Sheetsの認証または接続に失敗しました: {e}")
             raise
 
-    def _column_letter_to_number(self, column_letter):
-        """アルファベットの列文字を数値に変換 (A=1, B=2, ...)"""
-        num = 0
-        for char in column_letter.upper():
-            num = num * 26 + (ord(char) - ord('A') + 1)
-        return num
+    async def _call_rakuten_books_api(self, jan_code):
+        """楽天ブックス書籍検索APIを呼び出す (キャッシュ経由)"""
+        return await self._cached("books", jan_code, lambda: self._fetch_rakuten_books_api(jan_code))
+
+    async def _call_rakuten_product_api(self, jan_code):
+        """楽天商品検索APIを呼び出す (キャッシュ経由)"""
+        return await self._cached("product", jan_code, lambda: self._fetch_rakuten_product_api(jan_code))
 
-    def _call_rakuten_books_api(self, jan_code):
+    async def _get_json(self, url, params):
+        """楽天APIにGETしてJSONを返す (429はRetry-Afterに従い、5xxは指数バックオフで再試行する)"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            # トークンが枯渇しているときだけ補充されるまで待つ
+            await self._api_bucket.acquire()
+            async with self._rate:
+                async with self.session.get(url, params=params) as response:
+                    if response.status not in self.RETRY_STATUSES or attempt == self.MAX_RETRIES:
+                        response.raise_for_status()
+                        return _json_loads(await response.read())
+                    if response.status == 429:
+                        # サーバーから待機を指示された場合は、全リクエストの送信を遅らせる
+                        self._api_bucket.pause(retry_after_seconds(response.headers.get("Retry-After")))
+                        continue
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _fetch_rakuten_books_api(self, jan_code):
         """楽天ブックス書籍検索APIを呼び出す"""
-        self.logger(f"  📚 楽天ブックスで検索中...")
+        self.logger(f"  📚 楽天ブックスで検索中... (JAN/ISBN: {jan_code})")
         params = {
             "applicationId": self.config["rakuten_app_id"],
             "affiliateId": self.config.get("rakuten_affiliate_id", ""),
@@ -64,43 +180,34 @@ class RakutenBooksFinder:
             "hits": 1
         }
         try:
-            response = requests.get(self.RAKUTEN_BOOKS_API_URL, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._get_json(self.RAKUTEN_BOOKS_API_URL, params)
 
             if data.get("count", 0) == 0 or not data.get("Items"):
                 return None
 
             item = data["Items"][0]
             returned_isbn = item.get("isbn", "")
-            normalized_jan_code = str(jan_code).replace("-", "")
-            normalized_returned_isbn = str(returned_isbn).replace("-", "")
+            normalized_jan_code = str(jan_code).translate(_DASH_TBL)
+            normalized_returned_isbn = str(returned_isbn).translate(_DASH_TBL)
 
             if normalized_returned_isbn != normalized_jan_code:
-                self.logger(f"  ⚠️ ブックスAPIの検索結果コードが不一致 (返却: {returned_isbn})")
+                self.logger(f"  ⚠️ ブックスAPIの検索結果コードが不一致 (JAN/ISBN: {jan_code}, 返却: {returned_isbn})")
                 return None
             
             # データを統一的な形式で返す
-            return {
-                "type": "書籍",
-                "name": item.get("title", "情報なし"),
-                "price": item.get("itemPrice", "情報なし"),
-                "url": item.get("itemUrl", "情報なし"),
-                "detail": item.get("author", "情報なし"), # 著者
-                "caption": item.get("itemCaption", "情報なし"),
-                "review_avg": item.get("reviewAverage", "情報なし"),
-                "image_url": item.get("largeImageUrl", "情報なし").replace('?_ex=200x200', '')
-            }
-        except requests.exceptions.RequestException as e:
-            self.logger(f"  ❌ ブックスAPIリクエストエラー: {e}")
+            product_info = {key: item.get(src, default) if src else default for key, src, default in EXTRACT_BOOKS}
+            product_info["image_url"] = RAKUTEN_EX_RE.sub('', product_info["image_url"])
+            return product_info
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger(f"  ❌ ブックスAPIリクエストエラー (JAN/ISBN: {jan_code}): {e}")
             return None
         except Exception as e:
-            self.logger(f"  ❌ ブックスAPI処理中に予期せぬエラー: {e}")
+            self.logger(f"  ❌ ブックスAPI処理中に予期せぬエラー (JAN/ISBN: {jan_code}): {e}")
             return None
 
-    def _call_rakuten_product_api(self, jan_code):
+    async def _fetch_rakuten_product_api(self, jan_code):
         """楽天商品検索APIを呼び出す"""
-        self.logger(f"  🛒 楽天商品市場で検索中...")
+        self.logger(f"  🛒 楽天商品市場で検索中... (JAN/ISBN: {jan_code})")
         params = {
             "applicationId": self.config["rakuten_app_id"],
             "affiliateId": self.config.get("rakuten_affiliate_id", ""),
@@ -109,9 +216,7 @@ class RakutenBooksFinder:
             "hits": 1
         }
         try:
-            response = requests.get(self.RAKUTEN_PRODUCT_API_URL, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._get_json(self.RAKUTEN_PRODUCT_API_URL, params)
 
             if data.get("count", 0) == 0 or not data.get("Items"):
                 return None
@@ -129,77 +234,117 @@ class RakutenBooksFinder:
                 elif isinstance(first_image_data, str):
                     image_url = first_image_data
             
-            image_url = image_url.replace('?_ex=128x128', '')
             # --- 修正ここまで ---
 
             # データを統一的な形式で返す
-            return {
-                "type": "商品",
-                "name": item.get("itemName", "情報なし"),
-                "price": item.get("itemPrice", "情報なし"),
-                "url": item.get("itemUrl", "情報なし"),
-                "detail": item.get("shopName", "情報なし"), # 店舗名
-                "caption": item.get("itemCaption", "情報なし"),
-                "review_avg": item.get("reviewAverage", "情報なし"),
-                "image_url": image_url
-            }
-        except requests.exceptions.RequestException as e:
-            self.logger(f"  ❌ 商品APIリクエストエラー: {e}")
+            product_info = {key: item.get(src, default) if src else default for key, src, default in EXTRACT_PRODUCT}
+            product_info["image_url"] = RAKUTEN_EX_RE.sub('', image_url)
+            return product_info
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger(f"  ❌ 商品APIリクエストエラー (JAN/ISBN: {jan_code}): {e}")
             return None
         except Exception as e:
-            self.logger(f"  ❌ 商品API処理中に予期せぬエラー: {e}")
+            self.logger(f"  ❌ 商品API処理中に予期せぬエラー (JAN/ISBN: {jan_code}): {e}")
             return None
 
-    def _check_and_create_headers(self):
-        """出力列のヘッダーを確認し、なければ作成する"""
+    async def _lookup_batch(self, batch_data):
+        """1バッチ分のJAN/ISBNを同時に検索し、(行番号, 取得情報) のリストを返す"""
+        # セマフォとセッションはイベントループに紐づくため、asyncio.runごとに作り直す
+        concurrency = self.config.get("api_concurrency", 16)
+        self._rate = asyncio.Semaphore(concurrency)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.HTTP_TIMEOUT[0], sock_read=self.HTTP_TIMEOUT[1])
+        connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as self.session:
+            return await asyncio.gather(*[self._lookup_one(item) for item in batch_data])
+
+    async def _lookup_one(self, item):
+        """1件のJAN/ISBNについてブックス→商品の優先順で検索し、(行番号, 取得情報) を返す"""
+        self.logger(f"🔍 JAN/ISBN [{item['jan']}] を検索中...")
+        
+        # ブックスAPIの分とは別に空きトークンがある場合だけ、商品APIの検索を先に開始して待ち時間と重ねる
+        # (空きがないときに先行させると、ブックスAPIで見つかる大半のJANでトークンを無駄に消費するため)
+        product_task = None
+        if self._api_bucket.available() >= 2:
+            product_task = asyncio.create_task(self._call_rakuten_product_api(item['jan']))
+
+        # ブックスAPIで見つかればそちらを優先する
+        # (トークン待ちの間に取り消された商品APIの検索はトークンを消費しない)
+        product_info = await self._call_rakuten_books_api(item['jan'])
+        if product_info:
+            if product_task:
+                product_task.cancel()
+        elif product_task:
+            product_info = await product_task
+        else:
+            product_info = await self._call_rakuten_product_api(item['jan'])
+
+        if product_info:
+            self.logger(f"  => 取得成功 (JAN/ISBN: {item['jan']}): {str(product_info['name'])[:30]}...")
+        else:
+            self.logger(f"  => 最終的に情報は見つかりませんでした。(JAN/ISBN: {item['jan']})")
+        return item['row'], product_info
+
+    def _header_range(self):
+        """ヘッダー行の出力範囲 (A1形式) を返す"""
+        start_col = self.config['output_start_col_letter']
+        end_col = num_to_col(self._out_idx + len(self.OUTPUT_HEADERS))
+        return f"{self.sheet.title}!{start_col}1:{end_col}1"
+
+    def _batch_ranges(self, start_row, batch_size):
+        """処理対象バッチのJAN列と先頭の出力列の取得範囲 (A1形式) を返す"""
+        end_row = start_row + batch_size - 1
+        jan_col = self.config['jan_col_letter']
+        output_col = self.config['output_start_col_letter']
+        return [
+            f"{self.sheet.title}!{jan_col}{start_row}:{jan_col}{end_row}",
+            f"{self.sheet.title}!{output_col}{start_row}:{output_col}{end_row}",
+        ]
+
+    def _batch_get(self, ranges):
+        """複数の範囲を1回のbatchGetで取得し、範囲ごとの値のリストを返す"""
+        response = self.sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=self.config["spreadsheet_id"],
+            ranges=ranges
+        ).execute()
+        return [value_range.get('values', []) for value_range in response.get('valueRanges', [])]
+
+    def _check_and_create_headers(self, header_values):
+        """取得済みのヘッダー行を確認し、期待と異なる場合のみ作成・更新する"""
         try:
             self.logger("🔍 ヘッダーの確認...")
-            header_row = 1 
-            start_col = self.config['output_start_col_letter']
-            
-            first_header_cell_value = self.sheet.cell(header_row, self._column_letter_to_number(start_col)).value
-            
-            # ヘッダーを汎用的なものに変更
-            expected_headers = [
-                "種別", "名称", "価格", "URL", "詳細(著者/店舗)", 
-                "商品説明", "レビュー平均", "画像URL"
-            ]
+            current_headers = header_values[0] if header_values else []
 
-            if first_header_cell_value != expected_headers[0]:
+            if current_headers != self.OUTPUT_HEADERS:
                 self.logger("ℹ️ ヘッダーを作成または更新します...")
-                range_to_update = f"{start_col}{header_row}"
-                self.sheet.update(range_to_update, [expected_headers], value_input_option='USER_ENTERED')
+                self.sheets_service.spreadsheets().values().update(
+                    spreadsheetId=self.config["spreadsheet_id"],
+                    range=self._header_range(),
+                    valueInputOption='RAW',
+                    body={'values': [self.OUTPUT_HEADERS]}
+                ).execute()
                 self.logger("✅ ヘッダーの作成/更新が完了しました。")
             else:
                 self.logger("✅ ヘッダーは既に存在します。")
-        except gspread.exceptions.APIError as e:
+        except (gspread.exceptions.APIError, HttpError) as e:
             self.logger(f"❌ Google Sheets APIエラー: ヘッダーの確認中に問題が発生しました。: {e}")
             raise
         except Exception as e:
             self.logger(f"⚠️ ヘッダーの確認・作成中に予期せぬエラーが発生しました: {e}")
 
-    def _get_batch_data(self, start_row, batch_size):
-        """Google Sheetsから処理対象のJAN/ISBNコードを取得する"""
-        jan_col_letter = self.config["jan_col_letter"]
-        output_col_letter = self.config["output_start_col_letter"]
-        end_row = start_row + batch_size - 1
-        
+    def _get_batch_data(self, start_row, batch_size, values=None):
+        """Google Sheetsから処理対象のJAN/ISBNコードを取得する (取得済みの値があればそれを使う)"""
         try:
             self.logger(f"📊 データ取得中: {start_row}行目から{batch_size}行")
-            range_to_get = f"{self.sheet.title}!{jan_col_letter}{start_row}:{output_col_letter}{end_row}"
-            response = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.config["spreadsheet_id"],
-                range=range_to_get
-            ).execute()
-            
-            values = response.get('values', [])
-            batch_data = []
-            jan_col_index = 0
-            output_col_index = self._column_letter_to_number(output_col_letter) - self._column_letter_to_number(jan_col_letter)
+            # JAN列と先頭の出力列だけを取得し、処理済みかどうかは出力列の有無で判定する
+            # (書き込む値の先頭は必ず種別なので、未処理の行への書き込みが既存の値と一致することはない)
+            if values is None:
+                values = self._batch_get(self._batch_ranges(start_row, batch_size))
+            jan_values, output_values = values
 
-            for i, row_values in enumerate(values):
-                jan_code = row_values[jan_col_index] if len(row_values) > jan_col_index else ""
-                is_processed = len(row_values) > output_col_index and row_values[output_col_index]
+            batch_data = []
+            for i, jan_row in enumerate(jan_values):
+                jan_code = jan_row[0] if jan_row else ""
+                is_processed = i < len(output_values) and output_values[i] and output_values[i][0]
 
                 if jan_code.strip() and not is_processed:
                     batch_data.append({'row': start_row + i, 'jan': jan_code.strip()})
@@ -220,24 +365,13 @@ class RakutenBooksFinder:
             output_col = self.config['output_start_col_letter']
             data_to_write = []
             for item in update_data:
-                # 書き込むデータを汎用的な形式に合わせる
-                row_values = [
-                    item['product_info']['type'],
-                    item['product_info']['name'],
-                    item['product_info']['price'],
-                    item['product_info']['url'],
-                    item['product_info']['detail'],
-                    item['product_info']['caption'],
-                    item['product_info']['review_avg'],
-                    item['product_info']['image_url']
-                ]
                 data_to_write.append({
                     'range': f"{self.sheet.title}!{output_col}{item['row']}",
-                    'values': [row_values]
+                    'values': [list(_OUTPUT_GETTER(item['product_info']))]
                 })
             
             body = {'valueInputOption': 'USER_ENTERED', 'data': data_to_write}
-            result = self.sheets_service.spreadsheets().values().batchUpdate(
+            result = self._writer_service.spreadsheets().values().batchUpdate(
                 spreadsheetId=self.config["spreadsheet_id"], body=body
             ).execute()
             
@@ -245,20 +379,54 @@ class RakutenBooksFinder:
         except Exception as e:
             self.logger(f"❌ 一括更新エラー: {e}")
 
+    def _writer_loop(self):
+        """書き込みキューを消費し、溜まっている更新はまとめて1回で書き込む"""
+        running = True
+        while running:
+            update_data = self._write_q.get()
+            if update_data is None:
+                break
+            while True:
+                try:
+                    more = self._write_q.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    running = False
+                    break
+                update_data = update_data + more
+            self._batch_update_sheets(update_data)
+
     def run_process(self):
+        """メインの処理を実行し、書き込みスレッドの完了を待つ"""
+        try:
+            completed = self._run_batches()
+        finally:
+            # 書き込みスレッドに終了を通知し、残りの書き込みが終わるまで待つ
+            self._write_q.put(None)
+            self._writer.join()
+        if completed:
+            self.logger("\n🎉 全処理完了！ 🎉")
+
+    def _run_batches(self):
         """メインの処理ループを実行する"""
+        current_row = self.config["start_row"]
         try:
             self.logger("\n🚀 楽天情報取得処理開始 🚀")
-            self._check_and_create_headers()
-        except Exception:
-            self.logger(f"CRITICAL: ヘッダーの準備に失敗したため、処理を中止します。")
-            return
+            # ヘッダー行と最初のバッチを1回のbatchGetでまとめて取得する
+            header_values, *prefetched_values = self._batch_get(
+                [self._header_range()] + self._batch_ranges(current_row, self.config["batch_size"])
+            )
+            self._check_and_create_headers(header_values)
+        except Exception as e:
+            self.logger(f"CRITICAL: ヘッダーの準備に失敗したため、処理を中止します。: {e}")
+            return False
 
-        current_row = self.config["start_row"]
         consecutive_empty_batches = 0
         
         while True:
-            batch_data = self._get_batch_data(current_row, self.config["batch_size"])
+            batch_data = self._get_batch_data(current_row, self.config["batch_size"], prefetched_values)
+            prefetched_values = None
             
             if not batch_data:
                 consecutive_empty_batches += 1
@@ -270,30 +438,17 @@ class RakutenBooksFinder:
                 continue
             
             consecutive_empty_batches = 0
+            self._batch_bucket.consume()
             update_data = []
-            for item in batch_data:
-                self.logger(f"🔍 JAN/ISBN [{item['jan']}] を検索中...")
-                
-                # まずブックスAPIで検索
-                product_info = self._call_rakuten_books_api(item['jan'])
-                
-                # 見つからなければ商品APIで検索
-                if not product_info:
-                    product_info = self._call_rakuten_product_api(item['jan'])
-
+            # 各JANの検索はI/O待ちが支配的なため、イベントループ上で同時に実行する
+            for row, product_info in asyncio.run(self._lookup_batch(batch_data)):
                 if product_info:
-                    update_data.append({'row': item['row'], 'product_info': product_info})
-                    self.logger(f"  => 取得成功: {str(product_info['name'])[:30]}...")
-                else:
-                    self.logger(f"  => 最終的に情報は見つかりませんでした。")
-
-                time.sleep(1)
+                    update_data.append({'row': row, 'product_info': product_info})
 
             if update_data:
-                self._batch_update_sheets(update_data)
+                # 書き込みの完了は待たずに次のバッチの検索へ進む
+                self._write_q.put(update_data)
             
             current_row += self.config["batch_size"]
-            self.logger(f"⏳ 次のバッチまで{self.config['api_delay']}秒待機...")
-            time.sleep(self.config["api_delay"])
-            
-        self.logger("\n🎉 全処理完了！ 🎉")
+
+        return True